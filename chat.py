@@ -2,11 +2,15 @@ import os
 import time
 import json
 import asyncio
+import hashlib
+import threading
 import numpy as np
 import google.generativeai as genai
-from rank_bm25 import BM25Okapi
-from engine.embedder import BGEEmbedder 
+from engine.embedder import BGEEmbedder, EmbedQueue
+from engine.bm25 import SparseBM25
+from engine.utils import compress_code, estimate_tokens, CHARS_PER_TOKEN
 from data.storage import VectorStore 
+from utils.cache import QueryCache
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -30,6 +34,12 @@ TEMPLATES = {
     """
 }
 
+class _Shared:
+    """Process-wide embedder (and its batching queue) reused by every ModernizationChat."""
+    embedder = None
+    embed_queue = None
+    lock = threading.Lock()
+
 class ModernizationChat:
     def __init__(self, db_path=None, graph_path=None):
         self.api_key = os.getenv("GENAI_API_KEY")
@@ -38,14 +48,30 @@ class ModernizationChat:
 
         genai.configure(api_key=self.api_key)
         self.llm = genai.GenerativeModel('gemini-2.0-flash') 
-        self.embedder = BGEEmbedder()
+        self.embedder, self.embed_queue = self._shared_embedder()
         self.store = VectorStore(db_path=db_path) if db_path else VectorStore()
         
         self._table = None 
         self.entity_name = "Sales Invoice"
-        
-        # Load graph for expansion
-        self.cached_graph = self.store.load_graph(self.entity_name)
+        # Strip comments/docstrings/blank lines from code sent to the LLM
+        self.compress_context = True
+        # Token budget for the Relevant Code section (leaves room for template + output)
+        self.max_context_tokens = 7000
+        self.search_profile = "balanced"
+
+        # Repeated queries skip embedding and the vector scan
+        self._embedding_cache = QueryCache()
+        self._search_cache = QueryCache()
+        # Fully repeated interactions skip retrieval and Gemini
+        self._response_cache = QueryCache(max_size=256)
+        # Different queries can produce the same prompt (process_flow omits the query text)
+        self._prompt_cache = QueryCache(max_size=256)
+
+        # BM25 corpus is static between ingestions; built on first query
+        self._bm25 = None
+        self._corpus = None
+        self._id_to_idx = None
+        self._bm25_lock = threading.Lock()
 
     @property
     def table(self):
@@ -53,28 +79,69 @@ class ModernizationChat:
             self._table = self.store.get_table()
         return self._table
 
-    async def get_hybrid_context(self, query: str, limit: int = 8):
+    async def _get_table_async(self):
+        """The table handle; only the first open goes through a worker thread."""
+        if self._table is None:
+            self._table = await asyncio.to_thread(self.store.get_table)
+        return self._table
+
+    @staticmethod
+    def _shared_embedder():
+        with _Shared.lock:
+            if _Shared.embedder is None:
+                _Shared.embedder = BGEEmbedder()
+                # Concurrent requests (e.g. via server.py) share embedding batches
+                _Shared.embed_queue = EmbedQueue(_Shared.embedder)
+            return _Shared.embedder, _Shared.embed_queue
+
+    @classmethod
+    def warmup(cls):
+        """Runs a dummy embedding so Ollama has the model loaded before the first real query."""
+        embedder, _ = cls._shared_embedder()
+        embedder.embed_batch(["warmup"], is_query=True)
+
+    async def prefetch(self):
+        """
+        Warms the table handle, BM25 corpus and embedder concurrently, off the event loop.
+        Call once at startup so the first query doesn't pay for them serially.
+        """
+        await self._get_table_async()
+        await asyncio.gather(
+            asyncio.to_thread(self._get_bm25),
+            asyncio.to_thread(self.warmup)
+        )
+
+    async def get_hybrid_context(self, query: str, limit: int = 8, query_vec=None, candidates_limit=None):
         """
         Implements Hybrid Retrieval (Vector + BM25) with RRF fusion.
+        Pass `query_vec` to reuse an embedding computed elsewhere (e.g. in a batch).
+        `candidates_limit` is how many hits each path contributes to fusion (default: 2 * limit).
         """
-        if self.table is None:
+        candidates_limit = candidates_limit or limit * 2
+        if await self._get_table_async() is None:
             return "Error: Vector table not found.", 0, 0
 
         t_start = time.perf_counter()
         
-        # 1. Dense Search (Vector)
-        query_vec = (await asyncio.to_thread(self.embedder.embed_batch, [query]))[0]
-        dense_results = self.table.search(query_vec).limit(limit * 2).to_list()
-
-        # 2. Sparse Search (BM25)
-        all_chunks = self.table.to_pandas()
-        tokenized_corpus = [str(c).lower().split() for c in all_chunks['content']]
-        bm25 = BM25Okapi(tokenized_corpus)
-        sparse_scores = bm25.get_scores(query.lower().split())
+        # 1. Embed the query while the sparse (BM25) side runs concurrently
+        query_key = self._query_key(query)
+        if query_vec is None:
+            embed_task = asyncio.create_task(self.embed_query(query))
+        else:
+            embed_task = asyncio.sleep(0, result=np.ascontiguousarray(query_vec, dtype=np.float32))
+        sparse_task = asyncio.to_thread(self._sparse_search, query)
+        query_vec, (all_chunks, id_to_idx, sparse_scores) = await asyncio.gather(embed_task, sparse_task)
+
+        # 2. Dense Search (Vector)
+        search_key = (query_key, candidates_limit, self.search_profile)
+        dense_results = self._search_cache.get(search_key)
+        if dense_results is None:
+            dense_results = await asyncio.to_thread(self._dense_search, query_vec, candidates_limit)
+            self._search_cache.put(search_key, dense_results)
         
         # 3. Reciprocal Rank Fusion (RRF)
-        fused_indices = self._rrf_fusion(dense_results, all_chunks, sparse_scores, limit)
-        top_chunks = all_chunks.iloc[fused_indices]
+        fused_indices = self._rrf_fusion(dense_results, id_to_idx, sparse_scores, limit, candidates_limit)
+        top_chunks = all_chunks.take(fused_indices).to_pylist()
 
         # 4. Context Assembly 
         formatted_context = self._format_3_part_context(top_chunks, query)
@@ -82,65 +149,233 @@ class ModernizationChat:
         total_retrieval_ms = (time.perf_counter() - t_start) * 1000
         return formatted_context, total_retrieval_ms
 
-    def _rrf_fusion(self, dense, all_df, sparse_scores, limit, k=60):
+    @staticmethod
+    def _query_key(query):
+        """Cache key for a query string (embeddings, search results, responses)."""
+        return hashlib.sha256(query.encode('utf-8')).hexdigest()
+
+    async def embed_query(self, query):
+        """Returns the query vector, embedding it only on a cache miss."""
+        query_key = self._query_key(query)
+        query_vec = self._embedding_cache.get(query_key)
+        if query_vec is None:
+            query_vec = np.ascontiguousarray(await self.embed_queue.submit(query), dtype=np.float32)
+            self._embedding_cache.put(query_key, query_vec)
+        return query_vec
+
+    def _dense_search(self, query_vec, limit):
+        # Fusion only needs the ids (rows come from the BM25 corpus); keeps vectors and code out of _search_cache
+        return self.store.search(query_vec, limit, self.search_profile, columns=["id"])
+
+    async def _prefetch_embeddings(self, queries):
+        """Embeds all uncached queries in a single embed_batch call."""
+        keys = {self._query_key(q): q for q in queries}
+        missing = [k for k in keys if self._embedding_cache.get(k) is None]
+        if not missing:
+            return
+        vectors = await asyncio.to_thread(self.embedder.embed_batch, [keys[k] for k in missing])
+        # Failed items come back as None and are left to be embedded on demand
+        for key, vec in zip(missing, vectors):
+            if vec is not None:
+                self._embedding_cache.put(key, np.ascontiguousarray(vec, dtype=np.float32))
+
+    def _sparse_search(self, query):
+        """BM25 scores for every chunk in the table."""
+        bm25, corpus, id_to_idx = self._get_bm25()
+        return corpus, id_to_idx, bm25.get_scores(query.lower().split())
+
+    def _get_bm25(self):
+        """Returns (bm25, corpus, id_to_idx), building them on first use. `corpus` is an Arrow table."""
+        with self._bm25_lock:
+            if self._bm25 is None:
+                # Stay in Arrow (no pandas object columns); the projection keeps the vectors out of the read
+                columns = [field.name for field in self.table.schema if field.name != "vector"]
+                corpus = self.table.search().select(columns).limit(self.table.count_rows()).to_arrow()
+                tokenized_corpus = [str(c).lower().split() for c in corpus.column('content').to_pylist()]
+                # First row wins for duplicate ids, matching the old pandas lookup
+                id_to_idx = {}
+                for i, chunk_id in enumerate(corpus.column('id').to_pylist()):
+                    id_to_idx.setdefault(chunk_id, i)
+                self._bm25 = SparseBM25(tokenized_corpus)
+                self._corpus = corpus
+                self._id_to_idx = id_to_idx
+            return self._bm25, self._corpus, self._id_to_idx
+
+    def invalidate_bm25(self):
+        """Drops the cached BM25 corpus so the next query rebuilds it from the table."""
+        with self._bm25_lock:
+            self._bm25 = None
+            self._corpus = None
+            self._id_to_idx = None
+
+    def clear_caches(self):
+        """Invalidates cached embeddings, search results and responses (call after re-indexing)."""
+        self._embedding_cache.clear()
+        self._search_cache.clear()
+        self._response_cache.clear()
+        self._prompt_cache.clear()
+        self.invalidate_bm25()
+
+    def cache_stats(self):
+        return {
+            "embeddings": self._embedding_cache.stats(),
+            "search": self._search_cache.stats(),
+            "responses": self._response_cache.stats(),
+            "prompts": self._prompt_cache.stats()
+        }
+
+    def _rrf_fusion(self, dense, id_to_idx, sparse_scores, limit, candidates_limit, k=60):
         """Reciprocal Rank Fusion logic from Case Study."""
-        scores = {}
-        # Dense Ranks
-        for rank, res in enumerate(dense):
-            idx = all_df[all_df['id'] == res['id']].index[0]
-            scores[idx] = scores.get(idx, 0) + 1.0 / (k + rank + 1)
+        scores = np.zeros(len(sparse_scores))
+        # Dense Ranks (np.add.at so duplicate rows accumulate)
+        dense_hits = [(id_to_idx[res['id']], rank) for rank, res in enumerate(dense) if res['id'] in id_to_idx]
+        dense_idx = [idx for idx, _ in dense_hits]
+        if dense_hits:
+            idx, ranks = np.array(dense_hits).T
+            np.add.at(scores, idx, 1.0 / (k + ranks + 1))
         # Sparse Ranks
-        sparse_rank_indices = np.argsort(sparse_scores)[::-1][:limit*2]
-        for rank, idx in enumerate(sparse_rank_indices):
-            scores[idx] = scores.get(idx, 0) + 1.0 / (k + rank + 1)
-        
-        return sorted(scores.keys(), key=lambda x: scores[x], reverse=True)[:limit]
+        # O(N) partition, then sort only the kept top-k
+        k_sparse = min(candidates_limit, len(sparse_scores))
+        top = np.argpartition(sparse_scores, -k_sparse)[-k_sparse:] if k_sparse else np.empty(0, dtype=int)
+        sparse_rank_indices = top[np.argsort(-sparse_scores[top])]
+        scores[sparse_rank_indices] += 1.0 / (k + np.arange(len(sparse_rank_indices)) + 1)
 
-    def _format_3_part_context(self, chunks_df, query):
-        """Formats context into two sections: Relevant Code & Call Flow Diagram."""
+        # Ties keep first-seen order (dense before sparse)
+        fused = np.fromiter(dict.fromkeys(dense_idx + sparse_rank_indices.tolist()), dtype=np.intp)
+        return fused[np.argsort(-scores[fused], kind='stable')][:limit].tolist()
+
+    def _format_3_part_context(self, chunks, query):
+        """
+        Formats context into two sections: Relevant Code & Call Flow Diagram.
+        Blocks arrive in rank order; once the token budget runs out the lowest-ranked
+        code is truncated and the rest dropped.
+        """
         context_parts = ["## Relevant Code\n"]
+
+        # Call Flow Diagram (Placeholder logic); it counts against the same budget and may use
+        # at most a quarter of it, dropping lines from the end
+        flow_lines, flow_tokens = [], estimate_tokens("\n## Call Flow\n```\n\n```")
+        for line in self._generate_mermaid_flow(chunks).split("\n"):
+            line_tokens = estimate_tokens(line + "\n")
+            if flow_tokens + line_tokens > self.max_context_tokens // 4:
+                break
+            flow_lines.append(line)
+            flow_tokens += line_tokens
+        flow_section = "\n## Call Flow\n```\n" + "\n".join(flow_lines) + "\n```"
+        budget = self.max_context_tokens - estimate_tokens(context_parts[0]) - flow_tokens
+
+        # Measured once: the code fence (plus the join newline) and the truncation marker
+        truncated_marker = "\n# ... truncated"
+        fence_tokens = estimate_tokens("\n```python\n\n```\n")
+        marker_tokens = estimate_tokens(truncated_marker)
         
-        for _, row in chunks_df.iterrows():
+        for row in chunks:
             chunk_header = f"### {row['symbol_name']} ({row['symbol_type']})\n"
             chunk_meta = f"**File**: `{row['file_path']}:{row['start_line']}`\n"
             chunk_meta += f"**Hook**: {row.get('hook_type') or 'N/A'}\n"
             
-            chunk_code = f"```python\n{row['content']}\n```\n"
+            code = compress_code(row['content']) if self.compress_context else row['content']
+            remaining = budget - estimate_tokens(chunk_header + chunk_meta) - fence_tokens
+            if remaining <= 0:
+                break
+            if estimate_tokens(code) > remaining:
+                remaining -= marker_tokens
+                if remaining <= 0:
+                    break
+                code = code[:int(remaining * CHARS_PER_TOKEN)] + truncated_marker
+
+            chunk_code = f"```python\n{code}\n```\n"
+            budget -= estimate_tokens("\n" + chunk_header + chunk_meta + chunk_code)
             context_parts.append(chunk_header + chunk_meta + chunk_code)
 
-        # Call Flow Diagram (Placeholder logic)
-        context_parts.append("\n## Call Flow\n```\n" + self._generate_mermaid_flow(chunks_df) + "\n```")
+        context_parts.append(flow_section)
         return "\n".join(context_parts)
 
-    def _generate_mermaid_flow(self, chunks_df):
+    def _generate_mermaid_flow(self, chunks):
         """Basic representation of relationships."""
         flow = []
-        for name in chunks_df['symbol_name'].unique():
+        for name in dict.fromkeys(row['symbol_name'] for row in chunks):
             flow.append(f"  └── {name}()")
         return "\n".join(flow)
 
-    async def generate_domain_model(self, folder_path, query=None):
+    async def generate_domain_model(self, folder_path, query=None, on_chunk=None):
+        """
+        Retrieves context and asks Gemini for the domain model.
+        The response is streamed; `on_chunk` (if given) receives each text fragment as it arrives.
+        """
         active_query = query if query else f"Overview of {self.entity_name}"
+        intent = "process_flow" if "flow" in active_query.lower() else "debugging"
+
+        # Every setting that shapes the prompt is part of the key, so a config change misses
+        cache_key = (
+            self.entity_name, intent, self._query_key(active_query),
+            self.search_profile, self.compress_context, self.max_context_tokens
+        )
+        cached_text = self._response_cache.get(cache_key)
+        if cached_text is not None:
+            if on_chunk:
+                on_chunk(cached_text)
+            return cached_text, 0.0, 0.0
         
         # Retrieval
         context_text, r_lat = await self.get_hybrid_context(active_query)
 
         # Generation
-        selected_template = TEMPLATES["process_flow"] if "flow" in active_query.lower() else TEMPLATES["debugging"]
+        selected_template = TEMPLATES[intent]
         final_prompt = selected_template.format(
             entity_name=self.entity_name,
             user_query=active_query,
             context_data=context_text
         )
 
+        prompt_key = hashlib.blake2b(final_prompt.encode('utf-8')).hexdigest()
+        response_text = self._prompt_cache.get(prompt_key)
+        if response_text is not None:
+            if on_chunk:
+                on_chunk(response_text)
+            self._response_cache.put(cache_key, response_text)
+            return response_text, r_lat, 0.0
+
         start_gen = time.perf_counter()
         response = await self.llm.generate_content_async(
             final_prompt,
-            generation_config={"response_mime_type": "application/json", "temperature": 0.1}
+            generation_config={"response_mime_type": "application/json", "temperature": 0.1},
+            stream=True
         )
+        parts = []
+        async for chunk in response:
+            parts.append(chunk.text)
+            if on_chunk:
+                on_chunk(chunk.text)
         g_lat = (time.perf_counter() - start_gen) * 1000
 
-        return response.text, r_lat, g_lat
+        response_text = "".join(parts)
+        self._response_cache.put(cache_key, response_text)
+        self._prompt_cache.put(prompt_key, response_text)
+        return response_text, r_lat, g_lat
+
+    async def stream_domain_model(self, folder_path, query=None):
+        """Async-generator form of generate_domain_model: yields response text as it arrives."""
+        chunks = asyncio.Queue()
+        task = asyncio.create_task(
+            self.generate_domain_model(folder_path, query=query, on_chunk=chunks.put_nowait)
+        )
+        task.add_done_callback(lambda _: chunks.put_nowait(None))
+        while (text := await chunks.get()) is not None:
+            yield text
+        # Surface retrieval/generation errors to the consumer
+        await task
+
+    async def generate_domain_models(self, folders_and_queries: list):
+        """
+        Batched variant of generate_domain_model for multi-query sessions.
+        Embeds every query in one pass, then runs retrieval + generation concurrently.
+        """
+        pending = [(folder, query or f"Overview of {self.entity_name}") for folder, query in folders_and_queries]
+        await self._prefetch_embeddings([q for _, q in pending])
+        return await asyncio.gather(*[
+            self.generate_domain_model(folder, query=q) for folder, q in pending
+        ])
     
 if __name__ == "__main__":
     import nest_asyncio
@@ -148,13 +383,13 @@ if __name__ == "__main__":
     
     async def main():
         chat_agent = ModernizationChat()
+        print("=== Generated Response ===")
         response, retrieval_time, gen_time = await chat_agent.generate_domain_model(
             folder_path="path/to/local/repo",
-            query="What exactly does clear_unallocated_mode_of_payments do? Does it delete records or just clear a field?"
+            query="What exactly does clear_unallocated_mode_of_payments do? Does it delete records or just clear a field?",
+            on_chunk=lambda text: print(text, end="", flush=True)
         )
-        print("=== Generated Response ===")
-        print(response)
-        print(f"\nRetrieval Time: {retrieval_time:.2f} ms")
+        print(f"\n\nRetrieval Time: {retrieval_time:.2f} ms")
         print(f"Generation Time: {gen_time:.2f} ms")
     
     asyncio.run(main())
\ No newline at end of file
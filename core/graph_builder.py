@@ -1,8 +1,11 @@
 import os
+import sys
 import networkx as nx
 import requests
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
 import tree_sitter_python as tspython
-from tree_sitter import Language, Parser
+from tree_sitter import Language, Parser, Query, QueryCursor
 import logging
 from transformers import logging as transformers_logging
 
@@ -14,121 +17,236 @@ ERPNEXT_HOOKS = {
     'on_trash', 'after_delete'
 }
 
+def _nid(*parts):
+    """Node id for a path/class/function; interned so repeated ids share one string."""
+    return sys.intern(':'.join(parts))
+
 class CodeGraphPipeline:
+    # Below this many files, process start-up costs more than parallel pass 1 saves
+    parallel_min_files = 64
+
     def __init__(self):
         # KEY CHANGE: Suppress the noisy tokenizer warning at the source
         transformers_logging.set_verbosity_error() 
         
         self.lang = Language(tspython.language())
         self.parser = Parser(self.lang)
+        # Compiled once; matching runs in the tree-sitter C runtime instead of a Python recursion
+        self.def_query = Query(self.lang, """
+            (class_definition name: (identifier)) @class
+            (function_definition name: (identifier)) @def
+        """)
+        self.call_query = Query(self.lang, """
+            (function_definition) @def
+            (call function: (_) @callee)
+        """)
         self.G = nx.MultiDiGraph() 
+        # Keep-alive pool shared by the download threads
+        self.session = requests.Session()
+        self.session.mount("https://", HTTPAdapter(pool_connections=32, pool_maxsize=32))
         self.symbol_table = {} 
+        # rel_path -> {name: node_id}; first definition of a name in a file wins
+        self.nodes_by_file = {}
 
     def _get_name(self, node, code_bytes):
         name_node = node.child_by_field_name("name")
         if name_node:
-            return code_bytes[name_node.start_byte:name_node.end_byte].decode()
+            return name_node.text.decode()
         return None
     
-    def pass_1_symbols(self, rel_path, code_bytes):
+    def _captures(self, query, root):
+        """(node, capture_name) pairs for a compiled query, in traversal (pre-)order."""
+        captures = QueryCursor(query).captures(root)
+        return sorted(
+            ((node, name) for name, nodes in captures.items() for node in nodes),
+            key=lambda c: (c[0].start_byte, -c[0].end_byte)
+        )
+
+    def pass_1_symbols(self, rel_path, code_bytes, tree=None):
         """Phase 1: Build a granular symbol table (File -> Class -> Method)."""
-        tree = self.parser.parse(code_bytes)
-        # Ensure attributes are never None
-        self.G.add_node(rel_path, type='file', name=rel_path)
+        self._add_symbols(rel_path, *self._extract_symbols(rel_path, code_bytes, tree))
+
+    def _extract_symbols(self, rel_path, code_bytes, tree=None):
+        """
+        Pass 1 without touching shared state, so it can run in a worker process.
+        Returns (nodes, edges, symbols); `symbols` lists (name, node_id) in definition order.
+        """
+        nodes_buf, edges_buf, symbols = [], [], []
+        # No 'def'/'class' bytes at all (constants, __init__.py): nothing to parse
+        if b'def' not in code_bytes and b'class' not in code_bytes:
+            return nodes_buf, edges_buf, symbols
+
+        tree = tree or self.parser.parse(code_bytes)
+        rel_path = sys.intern(rel_path)
 
-        def traverse(node, current_class=None):
-            node_id = None  # Initialize to avoid UnboundLocalError
+        class_stack = []  # (end_byte, class_name) of the classes enclosing the current node
+        for node, capture in self._captures(self.def_query, tree.root_node):
+            while class_stack and class_stack[-1][0] <= node.start_byte:
+                class_stack.pop()
+            current_class = class_stack[-1][1] if class_stack else None
 
-            if node.type == 'class_definition':
+            if capture == 'class':
                 class_name = self._get_name(node, code_bytes)
                 if class_name:
-                    node_id = f"{rel_path}:{class_name}"
+                    node_id = _nid(rel_path, class_name)
                     # Use empty strings instead of None for GEXF compatibility
-                    self.G.add_node(node_id, 
-                        type='class', 
-                        name=class_name,
-                        doctype="Sales Invoice" if "SalesInvoice" in class_name else "" 
-                    )
-                    self.G.add_edge(rel_path, node_id, type='CONTAINS')
-                    self.symbol_table[class_name] = node_id
-                    current_class = class_name
-
-            elif node.type == 'function_definition':
+                    nodes_buf.append((node_id, {
+                        'type': 'class',
+                        'name': class_name,
+                        'doctype': "Sales Invoice" if "SalesInvoice" in class_name else ""
+                    }))
+                    edges_buf.append((rel_path, node_id, {'type': 'CONTAINS'}))
+                    symbols.append((class_name, node_id))
+                    class_stack.append((node.end_byte, class_name))
+
+            else:
                 func_name = self._get_name(node, code_bytes)
                 if func_name:
-                    prefix = f"{rel_path}:{current_class}" if current_class else rel_path
-                    node_id = f"{prefix}:{func_name}"
+                    parent_id = _nid(rel_path, current_class) if current_class else rel_path
+                    node_id = _nid(parent_id, func_name)
                     
                     # Identify hook or use empty string
                     hook = func_name if func_name in ERPNEXT_HOOKS else ""
                     
-                    self.G.add_node(node_id, 
-                        type='function', 
-                        name=func_name, 
-                        parent_class=current_class or "",
-                        hook_type=hook
-                    )
+                    nodes_buf.append((node_id, {
+                        'type': 'function',
+                        'name': func_name,
+                        'parent_class': current_class or "",
+                        'hook_type': hook
+                    }))
                     
-                    parent_id = f"{rel_path}:{current_class}" if current_class else rel_path
-                    self.G.add_edge(parent_id, node_id, type='CONTAINS')
-                    self.symbol_table[func_name] = node_id
+                    edges_buf.append((parent_id, node_id, {'type': 'CONTAINS'}))
+                    symbols.append((func_name, node_id))
 
-            for child in node.children: 
-                traverse(child, current_class)
-        
-        traverse(tree.root_node)
+        return nodes_buf, edges_buf, symbols
 
-    def pass_2_calls(self, rel_path, code_bytes):
+    def _add_symbols(self, rel_path, nodes_buf, edges_buf, symbols):
+        """Merges one file's pass-1 output into the graph and symbol tables."""
+        # Ensure attributes are never None
+        self.G.add_node(rel_path, type='file', name=rel_path)
+        self.G.add_nodes_from(nodes_buf)
+        self.G.add_edges_from(edges_buf)
+
+        file_nodes = self.nodes_by_file.setdefault(rel_path, {})
+        for name, node_id in symbols:
+            self.symbol_table[name] = node_id
+            file_nodes.setdefault(name, node_id)
+
+    def pass_2_calls(self, rel_path, code_bytes, tree=None):
         """Phase 2: Link specific function calls to their definitions."""
-        tree = self.parser.parse(code_bytes)
+        self._add_calls(self._extract_calls(code_bytes, self.nodes_by_file.get(rel_path, {}), tree))
+
+    def _extract_calls(self, code_bytes, file_nodes, tree=None):
+        """
+        Pass 2 without touching shared state, so it can run in a worker process.
+        Returns (caller_id, callee_name) pairs; `file_nodes` maps the file's names to node ids.
+        """
+        calls = []
+        # Calls are only linked from inside a function
+        if b'def' not in code_bytes:
+            return calls
+        tree = tree or self.parser.parse(code_bytes)
 
-        def traverse(node, current_caller_id=None):
-            if node.type == 'function_definition':
+        caller_stack = []  # (end_byte, caller_id) of the functions enclosing the current node
+        for node, capture in self._captures(self.call_query, tree.root_node):
+            while caller_stack and caller_stack[-1][0] <= node.start_byte:
+                caller_stack.pop()
+            current_caller_id = caller_stack[-1][1] if caller_stack else None
+
+            if capture == 'def':
                 func_name = self._get_name(node, code_bytes)
-                prefix = f"{rel_path}"
-                for n in self.G.nodes:
-                    if n.startswith(rel_path) and n.endswith(f":{func_name}"):
-                        current_caller_id = n
-                        break
-
-            elif node.type == 'call' and current_caller_id:
-                func_node = node.child_by_field_name('function')
-                if func_node:
-                    raw_call = code_bytes[func_node.start_byte:func_node.end_byte].decode()
-                    callee_name = raw_call.split('.')[-1]
-                    
-                    if callee_name in self.symbol_table:
-                        target_id = self.symbol_table[callee_name]
-                        if self.G.has_node(current_caller_id) and self.G.has_node(target_id):
-                            self.G.add_edge(current_caller_id, target_id, type='CALLS')
-            
-            for child in node.children: 
-                traverse(child, current_caller_id)
-                
-        traverse(tree.root_node)
-
-    def process_single_file(self, f_info, content):
-        """Processes a single file's symbols and adds them to the graph."""
+                current_caller_id = file_nodes.get(func_name, current_caller_id)
+                caller_stack.append((node.end_byte, current_caller_id))
+
+            elif current_caller_id:
+                raw_call = node.text.decode()
+                calls.append((current_caller_id, raw_call.split('.')[-1]))
+
+        return calls
+
+    def _add_calls(self, calls):
+        """Links one file's (caller_id, callee_name) pairs to the definitions seen so far."""
+        edges_buf = []
+        for caller_id, callee_name in calls:
+            if callee_name in self.symbol_table:
+                target_id = self.symbol_table[callee_name]
+                if self.G.has_node(caller_id) and self.G.has_node(target_id):
+                    edges_buf.append((caller_id, target_id, {'type': 'CALLS'}))
+        self.G.add_edges_from(edges_buf)
+
+    def process_single_file(self, f_info, content, graph=None):
+        """
+        Processes a single file's symbols and adds them to the graph.
+        `graph` is the (symbols, calls) output of extract_file_graph, if already computed (e.g. in a worker process).
+        """
         if not f_info['path'].endswith('.py'): return
-        
-        content_bytes = content.encode('utf-8')
         path = f_info['path']
-        
-        self.pass_1_symbols(path, content_bytes)
-        self.pass_2_calls(path, content_bytes)
+
+        if graph is None:
+            content_bytes = content.encode('utf-8')
+            tree = self.parser.parse(content_bytes) if b'def' in content_bytes or b'class' in content_bytes else None
+            self.pass_1_symbols(path, content_bytes, tree)
+            self.pass_2_calls(path, content_bytes, tree)
+        else:
+            symbols, calls = graph
+            self._add_symbols(path, *symbols)
+            self._add_calls(calls)
         print(f"   indexed graph symbols for: {path}")
 
-    def process_remote_files(self, remote_file_list):
-        contents = {}
-        for f_info in remote_file_list:
-            if not f_info['path'].endswith('.py'): continue
-            resp = requests.get(f_info['download_url'])
-            if resp.status_code == 200:
-                contents[f_info['path']] = resp.content
+    def process_remote_files(self, remote_file_list, max_workers=32):
+        py_files = [f_info for f_info in remote_file_list if f_info['path'].endswith('.py')]
+        # Downloads are I/O bound; map() keeps the list order so symbol resolution is unchanged
+        with ThreadPoolExecutor(max_workers=max_workers) as ex:
+            responses = ex.map(lambda f_info: self.session.get(f_info['download_url']), py_files)
+            contents = {
+                f_info['path']: resp.content
+                for f_info, resp in zip(py_files, responses) if resp.status_code == 200
+            }
         
-        for rel_path, code in contents.items(): 
-            self.pass_1_symbols(rel_path, code)
-        for rel_path, code in contents.items(): 
-            self.pass_2_calls(rel_path, code)
+        if len(contents) >= self.parallel_min_files and (os.cpu_count() or 1) > 1:
+            # Parsing is CPU bound: each worker parses a file once and extracts both passes;
+            # symbols are merged in input order before any call is linked
+            with ProcessPoolExecutor() as ex:
+                graphs = list(ex.map(_file_graph_worker, contents.items(), chunksize=8))
+            for rel_path, (symbols, _) in zip(contents, graphs):
+                self._add_symbols(rel_path, *symbols)
+            for _, calls in graphs:
+                self._add_calls(calls)
+        else:
+            # Parse once; both passes walk the same tree
+            trees = {
+                rel_path: self.parser.parse(code)
+                for rel_path, code in contents.items() if b'def' in code or b'class' in code
+            }
+            for rel_path, code in contents.items(): 
+                self.pass_1_symbols(rel_path, code, trees.get(rel_path))
+            for rel_path, code in contents.items(): 
+                self.pass_2_calls(rel_path, code, trees.get(rel_path))
         
-        return self.G
\ No newline at end of file
+        return self.G
+
+# One pipeline per worker process; parsers and queries can't be pickled
+_WORKER_PIPELINE = None
+
+def _worker_pipeline():
+    global _WORKER_PIPELINE
+    if _WORKER_PIPELINE is None:
+        _WORKER_PIPELINE = CodeGraphPipeline()
+    return _WORKER_PIPELINE
+
+def extract_file_graph(rel_path, code_bytes):
+    """
+    Pass-1 output and the raw (caller_id, callee_name) calls for one file, from a single parse.
+    Safe to call from any process; merge with CodeGraphPipeline.process_single_file(..., graph=...).
+    """
+    pipeline = _worker_pipeline()
+    tree = pipeline.parser.parse(code_bytes) if b'def' in code_bytes or b'class' in code_bytes else None
+    symbols = pipeline._extract_symbols(rel_path, code_bytes, tree)
+    file_nodes = {}
+    for name, node_id in symbols[2]:
+        file_nodes.setdefault(name, node_id)
+    return symbols, pipeline._extract_calls(code_bytes, file_nodes, tree)
+
+def _file_graph_worker(item):
+    rel_path, code = item
+    return extract_file_graph(rel_path, code)
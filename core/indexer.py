@@ -0,0 +1,10 @@
+from core.graph_builder import extract_file_graph
+from engine.chunker import chunk_file
+
+def index_file(path, content):
+    """
+    CPU-bound part of indexing one downloaded file: graph extraction and AST chunking.
+    Kept free of import-time side effects so worker processes can import it under spawn/forkserver.
+    """
+    graph = extract_file_graph(path, content.encode('utf-8')) if path.endswith('.py') else None
+    return graph, chunk_file(content, path)
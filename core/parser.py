@@ -2,12 +2,12 @@ import tree_sitter_python as tspython
 from tree_sitter import Language, Parser
 
 # ERPNext lifecycle hooks to prioritize
-ERPNEXT_HOOKS = {
+ERPNEXT_HOOKS = frozenset({
     'validate', 'before_validate', 'after_validate',
     'on_submit', 'before_submit', 'on_cancel',
     'on_update', 'after_insert', 'before_save',
     'on_trash', 'after_delete'
-}
+})
 
 class LocalGraphParser:
     def __init__(self):
@@ -31,7 +31,8 @@ class LocalGraphParser:
         chunks = []
 
         def get_text(node):
-            return content[node.start_byte:node.end_byte].decode('utf8')
+            # node.text is the node's own byte span; no slicing of the whole file
+            return node.text.decode('utf8')
 
         def traverse(node, current_class=None):
             # 1. Extract Definitions with full metadata
@@ -1,6 +1,9 @@
 import os
+import time
 from pathlib import Path
 import requests
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -13,42 +16,126 @@ class LocalScanner:
     def get_files(self) -> list[str]:
         """Scans local directory for source files and metadata."""
         file_list = []
-        for root, _, files in os.walk(self.root_dir):
-            for file in files:
-                if any(file.endswith(ext) for ext in self.extensions):
-                    file_list.append(os.path.abspath(os.path.join(root, file)))
+        # Scanning from an absolute root yields absolute entry paths, so no per-file abspath
+        self._scan_dir(os.path.abspath(self.root_dir), tuple(self.extensions), file_list)
         return file_list
 
+    def _scan_dir(self, path, extensions, file_list):
+        """os.walk order, but file/dir checks come from the cached DirEntry type (no extra stat)."""
+        subdirs = []
+        try:
+            with os.scandir(path) as it:
+                for entry in it:
+                    if entry.is_dir():
+                        # Like os.walk: symlinked dirs are not descended into
+                        if not entry.is_symlink():
+                            subdirs.append(entry.path)
+                    elif entry.name.endswith(extensions):
+                        file_list.append(entry.path)
+        except OSError:
+            return
+        for subdir in subdirs:
+            self._scan_dir(subdir, extensions, file_list)
+
 class GitHubScanner:
     def __init__(self):
         self.token = os.getenv("GITHUB_TOKEN")
         self.headers = {"Authorization": f"token {self.token}"} if self.token else {}
         self.extensions = ['.py', '.json'] 
+        # One keep-alive connection to api.github.com for every listing request
+        self.session = requests.Session()
+        self.session.headers.update(self.headers)
+        self.session.mount("https://", HTTPAdapter(pool_connections=10, pool_maxsize=10))
 
     def scan_remote_folder(self, owner, repo, path, branch="develop"):
         """
-        Recursively scans a GitHub folder for source files and DocType metadata.
+        Lists source files and DocType metadata under a GitHub folder.
+        Uses one Git Trees API call; falls back to the per-directory Contents API if that fails.
+        """
+        file_list = self._scan_tree(owner, repo, path, branch)
+        if file_list is None:
+            file_list = self._scan_contents(owner, repo, path, branch)
+        return file_list
+
+    def _scan_tree(self, owner, repo, path, branch):
+        """Whole-repo listing in a single request, filtered to `path` client-side. None on failure."""
+        api_url = f"https://api.github.com/repos/{owner}/{repo}/git/trees/{branch}?recursive=1"
+
+        try:
+            response = self.session.get(api_url)
+            if response.status_code != 200:
+                print(f"⚠️ Trees API unavailable for {path}: {response.status_code}")
+                return None
+
+            data = response.json()
+            if data.get('truncated'):
+                # Listing capped by GitHub (very large repos): it may be missing files under `path`
+                print(f"⚠️ Trees API listing truncated; scanning {path} per directory")
+                return None
+            tree = data['tree']
+        except Exception as e:
+            print(f"⚠️ Trees API Error at {path}: {e}")
+            return None
+
+        # Repo root (empty path): every blob matches
+        prefix = path.strip('/')
+        prefix = prefix + '/' if prefix else ''
+        extensions = tuple(self.extensions)
+        return [
+            {
+                "path": item['path'],
+                "download_url": f"https://raw.githubusercontent.com/{owner}/{repo}/{branch}/{item['path']}",
+                "type": "metadata" if item['path'].endswith('.json') else "source"
+            }
+            for item in tree
+            if item['type'] == 'blob' and item['path'].startswith(prefix) and item['path'].endswith(extensions)
+        ]
+
+    def _scan_contents(self, owner, repo, path, branch, max_workers=10):
+        """
+        Scans a GitHub folder level by level, listing each level's directories concurrently.
+        Results keep the depth-first order of the old recursive scan.
         """
+        listings = {}
+        level = [path]
+        with ThreadPoolExecutor(max_workers=max_workers) as ex:
+            while level:
+                results = ex.map(lambda dir_path: self._list_dir(owner, repo, dir_path, branch), level)
+                next_level = []
+                for dir_path, items in zip(level, results):
+                    listings[dir_path] = items
+                    # Subdirectories are common in complex DocTypes
+                    next_level.extend(item['path'] for item in items if item['type'] == 'dir')
+                level = next_level
+
+        return self._collect_files(path, listings)
+
+    def _list_dir(self, owner, repo, path, branch):
+        """One Contents API listing; [] on failure. A rate-limited request is retried once after the reset."""
         api_url = f"https://api.github.com/repos/{owner}/{repo}/contents/{path}?ref={branch}"
         
         try:
-            response = requests.get(api_url, headers=self.headers)
+            response = self.session.get(api_url)
+            if response.status_code in (403, 429) and response.headers.get("X-RateLimit-Remaining") == "0":
+                reset_at = int(response.headers.get("X-RateLimit-Reset", time.time()))
+                print(f"⏳ GitHub rate limit reached at {path}; waiting {max(0, reset_at - int(time.time()))}s to retry")
+                time.sleep(max(0, reset_at - time.time()) + 1)
+                response = self.session.get(api_url)
             if response.status_code != 200:
                 print(f"❌ Failed to access {path}: {response.status_code}")
                 return []
             
-            items = response.json()
+            return response.json()
         except Exception as e:
             print(f"⚠️ API Error at {path}: {e}")
             return []
 
+    def _collect_files(self, path, listings):
         file_list = []
 
-        for item in items:
+        for item in listings.get(path, []):
             if item['type'] == 'dir':
-                # Recursive scan for subdirectories (common in complex DocTypes)
-                sub_files = self.scan_remote_folder(owner, repo, item['path'], branch)
-                file_list.extend(sub_files)
+                file_list.extend(self._collect_files(item['path'], listings))
                 
             elif item['type'] == 'file':
                 # Check against target extensions
@@ -59,4 +146,4 @@ class GitHubScanner:
                         "type": "metadata" if item['name'].endswith('.json') else "source"
                     })
         
-        return file_list
\ No newline at end of file
+        return file_list
@@ -1,17 +1,40 @@
 import lancedb
+import numpy as np
 import pyarrow as pa
 import networkx as nx
 import os
+import math
 import pickle
 import json
+import sqlite3
+import threading
+from contextlib import closing
+
+# IVF search presets: partitions probed and PQ re-rank factor (ignored on unindexed tables)
+SEARCH_PROFILES = {
+    "fast": {"nprobes": 10, "refine_factor": None},
+    "balanced": {"nprobes": 20, "refine_factor": 5},
+    "recall": {"nprobes": 50, "refine_factor": 20}
+}
 
 class VectorStore:
+    # One connection per db_path, shared by every instance in the process
+    _connections = {}
+    _connections_lock = threading.Lock()
+
     def __init__(self, db_path="code_index_db"):
         self.db_path = db_path
-        self.db = lancedb.connect(self.db_path)
+        self.db = self._connect(db_path)
         self.table_name = "code_vectors"
+        self._table = None
+        # Per-path rows, so an update touches only the files that changed
+        self.hash_db_path = "file_hashes.db"
+        # Below this size brute-force search is already fast and PQ training is unreliable
+        self.ann_min_rows = 5000
+        # New rows are brute-force scanned until the index is rebuilt
+        self.reindex_fraction = 0.1
         self.schema = pa.schema([
-            pa.field("vector", pa.list_(pa.float32(), 768)),
+            pa.field("vector", pa.list_(pa.float32(), 768)),  # Unit L2 norm (BGEEmbedder)
             pa.field("id", pa.string()),           # Unique symbol ID
             pa.field("content", pa.string()),      # The code snippet
             pa.field("file_path", pa.string()),    # Source file
@@ -22,29 +45,102 @@ class VectorStore:
             pa.field("end_line", pa.int32())       # Line number
         ])
 
+    @classmethod
+    def _connect(cls, db_path):
+        with cls._connections_lock:
+            if db_path not in cls._connections:
+                cls._connections[db_path] = lancedb.connect(db_path)
+            return cls._connections[db_path]
+
     def get_table(self):
-        """Opens or creates the table with the updated schema."""
-        if self.table_name not in self.db.table_names():
-            return self.db.create_table(self.table_name, schema=self.schema)
-        return self.db.open_table(self.table_name)
+        """Opens or creates the table with the updated schema. The handle is reused across calls."""
+        if self._table is None:
+            if self.table_name not in self.db.table_names():
+                self._table = self.db.create_table(self.table_name, schema=self.schema)
+            else:
+                self._table = self.db.open_table(self.table_name)
+        return self._table
 
     def save_chunks(self, chunks: list):
         """
         Saves AST-based chunks into LanceDB.
-        Includes 'on_bad_vectors' handling for reliability.
+        Chunks are written as one Arrow batch; rows without a valid vector are dropped.
+        """
+        table = self.get_table()
+        batch = self._to_record_batch(chunks) if chunks else None
+        if batch is not None and batch.num_rows:
+            table.add(pa.Table.from_batches([batch]))
+
+    def _to_record_batch(self, chunks: list):
+        """Builds a schema-aligned RecordBatch, with the vectors as one float32 block."""
+        dim = self.schema.field("vector").type.list_size
+        rows = [c for c in chunks if c.get("vector") is not None and len(c["vector"]) == dim]
+        if len(rows) < len(chunks):
+            print(f"⚠️ Dropped {len(chunks) - len(rows)} chunks without a valid {dim}-dim vector")
+
+        vectors = np.asarray([c["vector"] for c in rows], dtype=np.float32).reshape(-1)
+        arrays = [
+            pa.FixedSizeListArray.from_arrays(pa.array(vectors), dim) if field.name == "vector"
+            else pa.array([c.get(field.name) for c in rows], type=field.type)
+            for field in self.schema
+        ]
+        return pa.RecordBatch.from_arrays(arrays, schema=self.schema)
+
+    def ensure_index(self, num_partitions=None, num_sub_vectors=96, index_type="IVF_PQ"):
+        """
+        Builds an ANN index on the vector column (idempotent).
+        Without it every search is a brute-force scan over all rows.
+        IVF_PQ stores product-quantized codes (96 bytes per 768-d vector by default), so searches read compressed vectors.
+        An existing index is rebuilt once more than `reindex_fraction` of the rows are unindexed.
+        `num_partitions` defaults to sqrt(rows).
         """
         table = self.get_table()
-        if chunks:
-            # LanceDB will automatically align these dicts to the Arrow schema
-            table.add(chunks, on_bad_vectors="drop")
+        num_rows = table.count_rows()
+        if num_rows < self.ann_min_rows:
+            return False
+        index = next((idx for idx in table.list_indices() if "vector" in idx.columns), None)
+        if index is not None:
+            stats = table.index_stats(index.name)
+            if stats is None or stats.num_unindexed_rows <= self.reindex_fraction * stats.num_indexed_rows:
+                return True
+        table.create_index(
+            metric="cosine",
+            index_type=index_type,
+            num_partitions=num_partitions or int(math.sqrt(num_rows)),
+            num_sub_vectors=num_sub_vectors,
+            vector_column_name="vector",
+            replace=True
+        )
+        print(f"✅ {index_type} index built on {self.table_name} ({num_rows} rows)")
+        return True
+
+    def search(self, query_vec, limit, profile="balanced", columns=None):
+        """
+        Dense top-`limit` rows for a query vector; every retrieval path (chat, evaluator, CodeSearcher) goes through here.
+        Same metric as the IVF-PQ index built by ensure_index; `profile` is a SEARCH_PROFILES key.
+        `columns` limits the returned fields (default: all, including the vector).
+        """
+        settings = SEARCH_PROFILES[profile]
+        search = self.get_table().search(query_vec).metric("cosine").limit(limit).nprobes(settings["nprobes"])
+        if columns is not None:
+            search = search.select(columns)
+        if settings["refine_factor"]:
+            search = search.refine_factor(settings["refine_factor"])
+        return search.to_list()
 
     def save_graph(self, G, entity_name):
         """Saves the NetworkX call graph for later retrieval."""
         graph_path = f"{entity_name}_graph.gpickle"
         with open(graph_path, 'wb') as f:
-            pickle.dump(G, f)
+            pickle.dump(G, f, protocol=pickle.HIGHEST_PROTOCOL)
         print(f"✅ Graph saved to {graph_path}")
 
+    def save_gexf(self, G, entity_name):
+        """Writes the GEXF export of the call graph."""
+        gexf_path = f"{entity_name}_graph.gexf"
+        nx.write_gexf(G, gexf_path)
+        return gexf_path
+
     def load_graph(self, entity_name):
         """Loads the graph into memory for context expansion."""
         graph_path = f"{entity_name}_graph.gpickle"
@@ -53,28 +149,61 @@ class VectorStore:
                 return pickle.load(f)
         return None
 
+    def _hash_db(self):
+        conn = sqlite3.connect(self.hash_db_path)
+        conn.execute("CREATE TABLE IF NOT EXISTS file_hashes (path TEXT PRIMARY KEY, hash TEXT NOT NULL, etag TEXT)")
+        if "etag" not in {row[1] for row in conn.execute("PRAGMA table_info(file_hashes)")}:
+            conn.execute("ALTER TABLE file_hashes ADD COLUMN etag TEXT")
+        return conn
+
     def check_file_hash(self, file_path, current_hash):
-        """Placeholder for incremental indexing logic."""
-        # You can implement a simple JSON or SQLite store for file hashes here
-        return False
+        """True if `file_path` was indexed with exactly this content hash."""
+        with closing(self._hash_db()) as conn:
+            row = conn.execute("SELECT hash FROM file_hashes WHERE path = ?", (file_path,)).fetchone()
+        return row is not None and row[0] == current_hash
 
     def load_hashes(self):
         """Loads existing file hashes to check for changes."""
-        hash_path = "file_hashes.json"
-        if os.path.exists(hash_path):
-            with open(hash_path, 'r') as f:
+        with closing(self._hash_db()) as conn:
+            hashes = dict(conn.execute("SELECT path, hash FROM file_hashes"))
+        if not hashes and os.path.exists("file_hashes.json"):
+            # Registry from before the SQLite store; migrated on the next save
+            with open("file_hashes.json", 'r') as f:
                 return json.load(f)
-        return {}
+        return hashes
 
-    def save_hashes(self, hashes: dict):
-        """Persists the current file hashes."""
-        hash_path = "file_hashes.json"
-        with open(hash_path, 'w') as f:
-            json.dump(hashes, f, indent=4)
-        print(f"✅ File hashes saved to {hash_path}")
+    def load_etags(self):
+        """HTTP ETags of the indexed downloads, for conditional (If-None-Match) re-fetches."""
+        with closing(self._hash_db()) as conn:
+            return dict(conn.execute("SELECT path, etag FROM file_hashes WHERE etag IS NOT NULL"))
+
+    def save_hashes(self, hashes: dict, etags: dict = None):
+        """
+        Persists the current file hashes (and ETags, if given; otherwise stored ETags are kept).
+        Only new, changed and removed paths are written, instead of rewriting the whole registry.
+        """
+        with closing(self._hash_db()) as conn:
+            with conn:
+                current = {path: (h, etag) for path, h, etag in conn.execute("SELECT path, hash, etag FROM file_hashes")}
+                removed = [(path,) for path in current if path not in hashes]
+                changed = []
+                for path, h in hashes.items():
+                    etag = current.get(path, (None, None))[1] if etags is None else etags.get(path)
+                    if current.get(path) != (h, etag):
+                        changed.append((path, h, etag))
+                conn.executemany("DELETE FROM file_hashes WHERE path = ?", removed)
+                conn.executemany("INSERT OR REPLACE INTO file_hashes (path, hash, etag) VALUES (?, ?, ?)", changed)
+        print(f"✅ File hashes saved to {self.hash_db_path} ({len(changed)} updated, {len(removed)} removed)")
 
     def delete_file_vectors(self, file_path: str):
         """Removes old vectors for a file before re-indexing."""
+        self.delete_file_vectors_batch([file_path])
+
+    def delete_file_vectors_batch(self, file_paths: list):
+        """Removes old vectors for many files with one delete (one tombstone write, not one per file)."""
+        if not file_paths:
+            return
         table = self.get_table()
-        # LanceDB uses SQL-like filtering for deletions
-        table.delete(f"file_path = '{file_path}'")
\ No newline at end of file
+        # LanceDB uses SQL-like filtering for deletions; quotes are doubled to escape them
+        paths = ", ".join("'" + path.replace("'", "''") + "'" for path in file_paths)
+        table.delete(f"file_path IN ({paths})")
\ No newline at end of file
@@ -0,0 +1,49 @@
+import numpy as np
+from collections import Counter
+from scipy.sparse import csr_matrix
+
+class SparseBM25:
+    def __init__(self, corpus: list, k1: float = 1.5, b: float = 0.75, epsilon: float = 0.25):
+        """
+        BM25Okapi over a precomputed sparse term-document matrix.
+        Scores match rank_bm25.BM25Okapi, but a query is one sparse mat-vec
+        instead of a Python loop over every document per term.
+        """
+        self.vocab = {}
+        rows, cols = [], []
+        doc_len = np.zeros(len(corpus))
+        for i, doc in enumerate(corpus):
+            doc_len[i] = len(doc)
+            for token in doc:
+                cols.append(self.vocab.setdefault(token, len(self.vocab)))
+                rows.append(i)
+
+        self.corpus_size = len(corpus)
+        tf = csr_matrix(
+            (np.ones(len(rows)), (rows, cols)),
+            shape=(self.corpus_size, len(self.vocab))
+        )
+        tf.sum_duplicates()
+
+        # IDF as in BM25Okapi: negative values are floored to epsilon * mean idf
+        doc_freq = np.bincount(tf.indices, minlength=len(self.vocab))
+        idf = np.log(self.corpus_size - doc_freq + 0.5) - np.log(doc_freq + 0.5)
+        if len(idf):
+            idf[idf < 0] = epsilon * idf.mean()
+
+        # Bake idf and length normalization into the stored weights
+        avgdl = doc_len.mean() if self.corpus_size and doc_len.any() else 1.0
+        norm = k1 * (1 - b + b * doc_len / avgdl)
+        doc_of_entry = np.repeat(np.arange(self.corpus_size), np.diff(tf.indptr))
+        tf.data = idf[tf.indices] * tf.data * (k1 + 1) / (tf.data + norm[doc_of_entry])
+
+        # Column-major so a query only touches the columns of its terms
+        self.weights = tf.tocsc()
+
+    def get_scores(self, query: list):
+        """BM25 score of every document for a tokenized query."""
+        counts = Counter(token for token in query if token in self.vocab)
+        if not counts:
+            return np.zeros(self.corpus_size)
+        cols = [self.vocab[token] for token in counts]
+        return self.weights[:, cols] @ np.fromiter(counts.values(), dtype=float, count=len(counts))
@@ -1,7 +1,9 @@
+import os
 import tree_sitter_python as tspython
 from tree_sitter import Language, Parser
 from typing import List, Dict, Any
 from dataclasses import dataclass
+from concurrent.futures import ProcessPoolExecutor
 
 # ERPNext lifecycle hooks to prioritize
 ERPNEXT_HOOKS = {
@@ -33,8 +35,19 @@ class HybridChunker:
 
     def _traverse_tree(self, node: Any, code: str, file_path: str, chunks: List[Dict]):
         """
-        Recursively extracts significant symbols (classes/methods).
+        Extracts significant symbols (classes/methods) in pre-order.
+        Walks with a TreeCursor instead of recursing, so deep ASTs cost no Python frames.
         """
+        cursor = node.walk()
+        while True:
+            self._visit_node(cursor.node, code, file_path, chunks)
+            if cursor.goto_first_child():
+                continue
+            while not cursor.goto_next_sibling():
+                if not cursor.goto_parent():
+                    return
+
+    def _visit_node(self, node: Any, code: str, file_path: str, chunks: List[Dict]):
         # Extract Classes (DocType controllers)
         if node.type == 'class_definition':
             chunks.append(self._create_chunk(node, code, file_path, "class"))
@@ -54,10 +67,6 @@ class HybridChunker:
             
             chunks.append(chunk)
 
-        # Continue traversal for child nodes
-        for child in node.children:
-            self._traverse_tree(child, code, file_path, chunks)
-
     def _create_chunk(self, node: Any, code: str, file_path: str, symbol_type: str) -> Dict:
         """
         Formats a node into the CodeChunk schema.
@@ -66,8 +75,8 @@ class HybridChunker:
         end_line = node.end_point[0] + 1
         symbol_name = self._get_node_name(node, code)
         
-        # Extract source code for the specific node
-        node_code = code.encode('utf8')[node.start_byte:node.end_byte].decode('utf8')
+        # Extract source code for the specific node (node.text: its own bytes, no re-encode of the file)
+        node_code = node.text.decode('utf8')
 
         return {
             "id": f"{file_path}:{symbol_name}",
@@ -84,5 +93,32 @@ class HybridChunker:
         """Helper to extract the name identifier from a node."""
         for child in node.children:
             if child.type == 'identifier':
-                return code.encode('utf8')[child.start_byte:child.end_byte].decode('utf8')
-        return "unknown"
\ No newline at end of file
+                return child.text.decode('utf8')
+        return "unknown"
+
+# One chunker per process; tree-sitter parsers can't be pickled to workers
+_CHUNKER = None
+
+def chunk_file(content: str, file_path: str) -> List[Dict[str, Any]]:
+    """chunk_erpnext_file on this process's shared HybridChunker."""
+    global _CHUNKER
+    if _CHUNKER is None:
+        _CHUNKER = HybridChunker()
+    return _CHUNKER.chunk_erpnext_file(content, file_path)
+
+def _chunk_path(path: str) -> List[Dict[str, Any]]:
+    with open(path, 'r', encoding='utf-8', errors='ignore') as f:
+        return chunk_file(f.read(), path)
+
+def chunk_files(paths: List[str], max_workers: int = None) -> List[Dict[str, Any]]:
+    """
+    Chunks many local files (e.g. LocalScanner.get_files()) across CPU cores.
+    Chunks come back flattened in input order.
+    """
+    max_workers = max_workers or os.cpu_count() or 1
+    if max_workers == 1 or len(paths) < 2:
+        results = map(_chunk_path, paths)
+        return [chunk for chunks in results for chunk in chunks]
+    with ProcessPoolExecutor(max_workers=max_workers) as ex:
+        results = ex.map(_chunk_path, paths, chunksize=16)
+        return [chunk for chunks in results for chunk in chunks]
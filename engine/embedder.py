@@ -1,38 +1,121 @@
+import asyncio
+import numpy as np
 import requests
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
 
 class BGEEmbedder:
-    def __init__(self, model_name: str = "nomic-embed-text"):
+    def __init__(self, model_name: str = "nomic-embed-text", batch_size: int = 32, max_workers: int = 4):
         self.model_name = model_name
-        self.url = "http://localhost:11434/api/embeddings"
+        # Batch endpoint: one request embeds a whole list of inputs
+        self.url = "http://localhost:11434/api/embed"
+        self.batch_size = batch_size
+        # Concurrent batches in flight; only helps if Ollama runs with OLLAMA_NUM_PARALLEL > 1
+        self.max_workers = max_workers
+        # Reuse keep-alive connections to Ollama instead of a new socket per request
+        self.session = requests.Session()
+        self.session.mount("http://", HTTPAdapter(pool_connections=4, pool_maxsize=max(8, max_workers)))
 
     def embed_batch(self, texts: list, is_query: bool = False):
         """
         Generates 768-dim vectors via Ollama. 
         Aligned with Phase 1 Indexing architecture.
+        Vectors are L2-normalized here, so cosine similarity equals the dot product downstream.
+        Always returns one slot per input; texts whose batch failed come back as None.
         """
-        vectors = []
         # Nomic performs better with task-specific prefixes
         prefix = "search_query: " if is_query else "search_document: "
-        
-        for text in texts:
+        # Prepend prefix to improve retrieval precision
+        batches = [
+            [f"{prefix}{text}" for text in texts[i : i + self.batch_size]]
+            for i in range(0, len(texts), self.batch_size)
+        ]
+
+        if len(batches) > 1 and self.max_workers > 1:
+            # I/O bound: threads overlap the round trips; map() keeps batch order
+            with ThreadPoolExecutor(max_workers=self.max_workers) as ex:
+                results = list(ex.map(self._embed_one_batch, batches))
+        else:
+            results = [self._embed_one_batch(batch) for batch in batches]
+
+        return [vec for result in results for vec in result]
+
+    def _embed_one_batch(self, inputs: list):
+        """One /api/embed call; returns a None per input (and logs) if the batch fails."""
+        try:
+            payload = {
+                "model": self.model_name, 
+                "input": inputs
+            }
+            
+            response = self.session.post(self.url, json=payload, timeout=120)
+            response.raise_for_status()
+            embeddings = np.asarray(response.json()['embeddings'], dtype=np.float32)
+            
+            # Validation against the LanceDB schema
+            if embeddings.ndim == 2 and embeddings.shape[1] == 768:
+                norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+                norms[norms == 0] = 1
+                return (embeddings / norms).tolist()
+            print(f"⚠️ Warning: Model returned shape {embeddings.shape}, expected (n, 768).")
+        except Exception as e:
+            print(f"❌ Embedding error: {e}")
+        return [None] * len(inputs)
+
+class EmbedQueue:
+    def __init__(self, embedder, max_batch: int = 32, batch_delay: float = 0.005):
+        """
+        Dynamic batching front-end for an embedder.
+        Concurrent submit() calls arriving within `batch_delay` seconds share one embed_batch call.
+        """
+        self.embedder = embedder
+        self.max_batch = max_batch
+        self.batch_delay = batch_delay
+        self._loop = None
+        self._queue = None
+        self._worker = None
+
+    async def submit(self, text: str):
+        """Queues a text and waits for its vector."""
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # Queue and worker are bound to the loop they were created on
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._worker = loop.create_task(self._run())
+
+        future = loop.create_future()
+        await self._queue.put((text, future))
+        return await future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            items = [await self._queue.get()]
+            deadline = loop.time() + self.batch_delay
+            while len(items) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    items.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            texts = [text for text, _ in items]
             try:
-                # Prepend prefix to improve retrieval precision
-                payload = {
-                    "model": self.model_name, 
-                    "prompt": f"{prefix}{text}"
-                }
-                
-                response = requests.post(self.url, json=payload, timeout=30)
-                response.raise_for_status()
-                embedding = response.json()['embedding']
-                
-                # Validation against the LanceDB schema
-                if len(embedding) == 768:
-                    vectors.append(embedding)
-                else:
-                    print(f"⚠️ Warning: Model returned {len(embedding)} dims, expected 768.")
-                    # Fallback or padding could be added here if needed
+                vectors = await asyncio.to_thread(self.embedder.embed_batch, texts)
             except Exception as e:
-                print(f"❌ Embedding error: {e}")
-                
-        return vectors
\ No newline at end of file
+                # Fail this batch's waiters but keep the worker alive for later submits
+                for _, future in items:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            for (_, future), vec in zip(items, vectors):
+                if future.done():
+                    continue
+                if vec is None:
+                    future.set_exception(RuntimeError("Embedding failed"))
+                else:
+                    future.set_result(vec)
@@ -1,13 +1,17 @@
+import io
+import math
 import re
+import tokenize
+
+# Owner, repo, branch and folder path of a GitHub tree URL (compiled once)
+_GITHUB_TREE_RE = re.compile(r"https://github\.com/([^/]+)/([^/]+)/tree/([^/]+)/(.*)")
 
 def parse_github_url(url: str):
     """
     Parses a GitHub web URL into API components.
     Logic: Uses Regular Expressions (Regex) to find patterns in the string.
     """
-    # This pattern looks for the owner, repo, branch, and folder path
-    pattern = r"https://github\.com/([^/]+)/([^/]+)/tree/([^/]+)/(.*)"
-    match = re.match(pattern, url)
+    match = _GITHUB_TREE_RE.match(url)
     
     if match:
         return {
@@ -20,6 +24,50 @@ def parse_github_url(url: str):
     # Fallback for root repository URLs
     return None
 
+def compress_code(code: str) -> str:
+    """
+    Strips comments, docstrings and blank lines from a Python snippet.
+    Used to shrink the code blocks sent to the LLM; returns the input unchanged
+    if the snippet cannot be tokenized.
+    """
+    try:
+        tokens = list(tokenize.generate_tokens(io.StringIO(code).readline))
+    except (tokenize.TokenError, IndentationError, SyntaxError):
+        return code
+
+    statement_start = (tokenize.NEWLINE, tokenize.INDENT, tokenize.DEDENT)
+    block_end = (tokenize.DEDENT, tokenize.ENDMARKER)
+    spans = []
+    prev_type = tokenize.NEWLINE
+    for i, tok in enumerate(tokens):
+        if tok.type == tokenize.COMMENT:
+            spans.append((tok.start, tok.end, ""))
+        elif tok.type == tokenize.STRING and prev_type in statement_start \
+                and tokens[i + 1].type in (tokenize.NEWLINE, tokenize.ENDMARKER):
+            # A bare string statement: docstring. If it is the whole body of a block,
+            # leave `...` so the class/def header stays valid Python.
+            next_type = next(
+                (t.type for t in tokens[i + 2:] if t.type not in (tokenize.NL, tokenize.COMMENT)),
+                tokenize.ENDMARKER
+            )
+            sole_body = prev_type == tokenize.INDENT and next_type in block_end
+            spans.append((tok.start, tok.end, "..." if sole_body else ""))
+        if tok.type not in (tokenize.NL, tokenize.COMMENT):
+            prev_type = tok.type
+
+    lines = code.split("\n")
+    for (start_row, start_col), (end_row, end_col), replacement in reversed(spans):
+        lines[start_row - 1:end_row] = [lines[start_row - 1][:start_col] + replacement + lines[end_row - 1][end_col:]]
+
+    return "\n".join(line.rstrip() for line in lines if line.strip())
+
+# Rough chars-per-token ratio for code; errs towards over-counting
+CHARS_PER_TOKEN = 3.5
+
+def estimate_tokens(text: str) -> int:
+    """Cheap local token estimate used to keep prompts inside the model budget."""
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
 # Example Test:
 # url = "https://github.com/frappe/erpnext/tree/develop/erpnext/accounts/doctype/sales_invoice"
 # print(parse_github_url(url))
\ No newline at end of file
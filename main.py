@@ -3,11 +3,12 @@ import dagshub
 import json
 import asyncio
 import hashlib
-import networkx as nx
 import aiohttp
+from concurrent.futures import ProcessPoolExecutor
 from engine.utils import parse_github_url
 from core.scanner import GitHubScanner
 from core.graph_builder import CodeGraphPipeline
+from core.indexer import index_file
 from data.storage import VectorStore
 from engine.embedder import BGEEmbedder
 from engine.chunker import HybridChunker
@@ -17,33 +18,53 @@ from utils.graph_to_mermaid import export_folder_to_mermaid
 
 dagshub.init(repo_owner='Aagambot', repo_name='AI-modernization-tool', mlflow=True)
 
-def get_content_hash(content: str) -> str:
-    """Generates a SHA-256 hash to detect file changes."""
-    return hashlib.sha256(content.encode('utf-8')).hexdigest()
+def get_content_hash(content_bytes: bytes) -> str:
+    """
+    Generates a SHA-256 hash to detect file changes.
+    Hashes the raw body. For valid UTF-8 content this equals the old hash of the decoded text,
+    so stored hashes stay valid; files with invalid bytes hash differently and are re-indexed once.
+    """
+    return hashlib.sha256(content_bytes).hexdigest()
 
-async def fetch_and_process(session, f_info, chunker, existing_hashes, builder):
+async def fetch_and_process(session, f_info, chunker, existing_hashes, builder, pool=None, etag=None):
     """
     Aligned with Phase 2: AST-based extraction and metadata mapping.
+    With a process `pool`, parsing and chunking run there so the event loop keeps downloading.
+    Returns (chunks, hash, etag); chunks is None when the file is unchanged.
     """
+    path = f_info['path']
+    # 0. Conditional GET: an indexed file with a known ETag comes back as an empty 304 if unchanged
+    headers = {"If-None-Match": etag} if etag and path in existing_hashes else None
     try:
-        async with session.get(f_info['download_url']) as response:
-            content = await response.text(errors='ignore')
-            new_hash = get_content_hash(content)
+        async with session.get(f_info['download_url'], headers=headers) as response:
+            if response.status == 304:
+                return None, existing_hashes[path], etag
+            body = await response.read()
+            new_hash = get_content_hash(body)
+            new_etag = response.headers.get("ETag")
             
-            # 1. Delta Check: Skip if unchanged
-            if existing_hashes.get(f_info['path']) == new_hash:
-                return None, new_hash 
+            # 1. Delta Check: Skip if unchanged (before paying for the decode)
+            if existing_hashes.get(path) == new_hash:
+                return None, new_hash, new_etag
+            content = body.decode('utf-8', errors='ignore')
 
-            # 2. Structural Symbol Extraction (Pass 1 of Graph)
-            builder.process_single_file(f_info, content)
-            
-            # 3. AST-based Chunking
-            raw_chunks = chunker.chunk_erpnext_file(content, f_info['path'])
+            if pool is not None:
+                # 2 + 3. Graph extraction and AST-based Chunking in one process hop
+                loop = asyncio.get_running_loop()
+                graph, raw_chunks = await loop.run_in_executor(pool, index_file, path, content)
+                # Only the merge into the shared graph (symbols, call linking) runs here
+                builder.process_single_file(f_info, content, graph)
+            else:
+                # 2. Structural Symbol Extraction (Pass 1 of Graph)
+                builder.process_single_file(f_info, content)
+                
+                # 3. AST-based Chunking
+                raw_chunks = chunker.chunk_erpnext_file(content, f_info['path'])
             
-            return raw_chunks, new_hash
+            return raw_chunks, new_hash, new_etag
     except Exception as e:
         print(f"⚠️ Error: {f_info['path']}: {e}")
-        return [], None
+        return [], None, None
 
 async def run_modernization_pipeline(github_url: str):
     repo_info = parse_github_url(github_url)
@@ -59,57 +80,108 @@ async def run_modernization_pipeline(github_url: str):
 
     # Delta Indexing: Load state
     existing_hashes = store.load_hashes()
-    new_hashes = {}
+    existing_etags = store.load_etags()
+    new_hashes, new_etags = {}, {}
+    fetched_hashes = {}  # Files with new chunks; recorded only once all their chunks are embedded
     all_new_chunks = []
+    changed_paths = []  # Previously indexed files whose content changed
 
     remote_files = scanner.scan_remote_folder(
         repo_info['owner'], repo_info['repo'], repo_info['path'], repo_info['branch']
     )
 
     print(f"🔗 Processing {len(remote_files)} files...")
-    async with aiohttp.ClientSession() as session:
+    # Keep-alive pool capped at 16 sockets; the scanner's token also covers private raw URLs
+    connector = aiohttp.TCPConnector(limit=16)
+    # Parsing is CPU bound; with more than one core (and enough files to pay for worker start-up) it moves off the event loop
+    use_pool = (os.cpu_count() or 1) > 1 and len(remote_files) >= CodeGraphPipeline.parallel_min_files
+    pool = ProcessPoolExecutor() if use_pool else None
+    async with aiohttp.ClientSession(connector=connector, headers=scanner.headers) as session:
         # Create tasks for all remote files
-        tasks = [fetch_and_process(session, f, chunker, existing_hashes, builder) for f in remote_files]
-        results = await asyncio.gather(*tasks)
+        tasks = [
+            fetch_and_process(session, f, chunker, existing_hashes, builder, pool, existing_etags.get(f['path']))
+            for f in remote_files
+        ]
+        try:
+            results = await asyncio.gather(*tasks)
+        finally:
+            if pool is not None:
+                pool.shutdown()
         
-        for i, (chunks, f_hash) in enumerate(results):
+        for i, (chunks, f_hash, etag) in enumerate(results):
             path = remote_files[i]['path']
             # If chunks is None, file was unchanged (Delta Indexing)
             if chunks is None:
                 new_hashes[path] = existing_hashes[path]
-                continue
+
+            # Fetch failed: keep the previous state, so the next run still sees the file as indexed
+            elif f_hash is None:
+                if path in existing_hashes:
+                    new_hashes[path] = existing_hashes[path]
+                    etag = existing_etags.get(path)
             
             # If we have new AST chunks, add them to the batch
-            if chunks:
+            elif chunks:
                 all_new_chunks.extend(chunks)
-                new_hashes[path] = f_hash
-                # store.delete_file_vectors(path)
+                fetched_hashes[path] = f_hash
+                if path in existing_hashes:
+                    changed_paths.append(path)
+
+            # Changed and now yields no chunks: only its stale rows need to go
+            elif path in existing_hashes:
+                changed_paths.append(path)
+
+            if etag and (path in new_hashes or path in fetched_hashes):
+                new_etags[path] = etag
     
+    failed_paths = set()
     if all_new_chunks:
         print(f"🧬 Embedding {len(all_new_chunks)} AST-based chunks...")
-        batch_size = 64
-        for i in range(0, len(all_new_chunks), batch_size):
-            batch = all_new_chunks[i : i + batch_size]
-            texts = [c['code'] for c in batch]
-            
-            # Use prefixing for high-precision document indexing
-            embeddings = await asyncio.to_thread(embedder.embed_batch, texts, is_query=False)
-            
-            for j, emb in enumerate(embeddings):
+        # Identical bodies (stubs, re-exports, boilerplate hooks) are embedded once
+        unique_texts = list(dict.fromkeys(c['code'] for c in all_new_chunks))
+
+        # One call: the embedder batches and runs requests concurrently itself
+        # Use prefixing for high-precision document indexing
+        embeddings = await asyncio.to_thread(embedder.embed_batch, unique_texts, is_query=False)
+        vectors = {text: vec for text, vec in zip(unique_texts, embeddings) if vec is not None}
+
+        for chunk in all_new_chunks:
+            if chunk['code'] in vectors:
                 # Map to the VectorStore schema
-                batch[j]['vector'] = emb
-                batch[j]['content'] = batch[j].pop('code') 
-        
-        # Save to LanceDB with the expanded metadata
-        store.save_chunks(all_new_chunks)
+                chunk['vector'] = vectors[chunk['code']]
+                chunk['content'] = chunk.pop('code')
+
+        # A file is replaced only if every one of its chunks got a vector; otherwise its old
+        # rows and hash stay, so the next run re-indexes it
+        failed_paths = {c['file_path'] for c in all_new_chunks if 'vector' not in c}
+        if failed_paths:
+            print(f"⚠️ Embedding failed for {len(failed_paths)} files; they will be retried on the next run")
+
+        for path in failed_paths:
+            del fetched_hashes[path]
+            new_etags.pop(path, None)
+            if path in existing_hashes:
+                new_hashes[path] = existing_hashes[path]
+    new_hashes.update(fetched_hashes)
+
+    # Drop the stale rows of changed files in one delete, then save with the expanded metadata
+    store.delete_file_vectors_batch([p for p in changed_paths if p not in failed_paths])
+    if all_new_chunks:
+        store.save_chunks([c for c in all_new_chunks if c['file_path'] not in failed_paths])
+        store.ensure_index()
     
-    store.save_hashes(new_hashes)
+    # Nothing changed on a re-run: skip rewriting the registry
+    if new_hashes != existing_hashes or new_etags != existing_etags:
+        store.save_hashes(new_hashes, new_etags)
 
     # Persist Artifacts
-    graph_filename = f"{entity_name}_graph.gexf"
-    nx.write_gexf(builder.G, graph_filename)
+    store.save_gexf(builder.G, entity_name)
     store.save_graph(builder.G, entity_name)
-    export_folder_to_mermaid(graph_filename, folder_name=entity_name, output_file=f"{entity_name}_flow.md")
+    # Reuse the graph in memory instead of re-parsing the GEXF just written
+    export_folder_to_mermaid(builder.G, folder_name=entity_name, output_file=f"{entity_name}_flow.md")
+
+    # Responses and the BM25 corpus cached before this run describe the old index
+    evaluator.chat.clear_caches()
 
     # Evaluation
     print("🧠 Starting Evaluation...")
@@ -1,6 +1,7 @@
 import uvicorn
 import os
 from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from chat import ModernizationChat
 from fastapi.middleware.cors import CORSMiddleware
@@ -23,6 +24,11 @@ GRAPH_PATH = "./erpnext_graph.gpickle" # Your existing NetworkX graph
 # We assume ModernizationChat is updated to accept these paths in __init__
 chat_engine = ModernizationChat()
 
+@app.on_event("startup")
+async def warm_up():
+    # Open the table, build the BM25 corpus and warm the embedder before the first request
+    await chat_engine.prefetch()
+
 class QueryRequest(BaseModel):
     query: str
     limit: int = 8
@@ -54,5 +60,16 @@ async def ask_logic(request: QueryRequest):
     except Exception as e:
         return {"error": str(e)}
 
+@app.post("/ask/stream")
+async def ask_logic_stream(request: QueryRequest):
+    """
+    Streaming variant of /ask: sends the answer text as Gemini generates it,
+    so the sidebar can start rendering before the full JSON is ready.
+    """
+    return StreamingResponse(
+        chat_engine.stream_domain_model(folder_path=None, query=request.query),
+        media_type="text/plain"
+    )
+
 if __name__ == "__main__":
     uvicorn.run(app, host="127.0.0.1", port=8000)
\ No newline at end of file
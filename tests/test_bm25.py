@@ -0,0 +1,45 @@
+import numpy as np
+from rank_bm25 import BM25Okapi
+
+from engine.bm25 import SparseBM25
+
+
+CORPUS = [
+    "def validate self set totals".split(),
+    "def on submit self make gl entries".split(),
+    [],
+    "def validate self validate self validate".split(),
+    "make gl entries self".split(),
+    "def update stock ledger self".split(),
+]
+
+
+def assert_same_scores(corpus, query):
+    np.testing.assert_allclose(
+        SparseBM25(corpus).get_scores(query),
+        BM25Okapi(corpus).get_scores(query),
+        rtol=1e-12, atol=1e-12
+    )
+
+
+def test_scores_match_bm25okapi():
+    assert_same_scores(CORPUS, ["make", "gl", "entries"])
+
+
+def test_repeated_query_terms():
+    assert_same_scores(CORPUS, ["validate", "validate", "totals"])
+
+
+def test_out_of_vocabulary_tokens():
+    assert_same_scores(CORPUS, ["unknown", "validate", "missing"])
+    assert_same_scores(CORPUS, ["unknown"])
+
+
+def test_empty_documents():
+    assert_same_scores(CORPUS, ["stock", "ledger"])
+    assert_same_scores([[], ["stock"], []], ["stock"])
+
+
+def test_negative_idf_epsilon_floor():
+    # "self" and "def" occur in more than half of the documents, so their raw idf is negative
+    assert_same_scores(CORPUS, ["self", "def", "submit"])
@@ -0,0 +1,31 @@
+import ast
+
+from engine.utils import compress_code
+
+
+def test_docstring_only_bodies_keep_a_placeholder():
+    code = '''class PartialPaymentValidationError(frappe.ValidationError):
+    """Raised when a partial payment is not allowed."""
+
+
+def on_submit(self):
+    # Hook entry point
+    """Nothing to do yet."""
+'''
+    compressed = compress_code(code)
+    ast.parse(compressed)
+    assert compressed == (
+        "class PartialPaymentValidationError(frappe.ValidationError):\n"
+        "    ...\n"
+        "def on_submit(self):\n"
+        "    ..."
+    )
+
+
+def test_docstring_before_statements_is_dropped():
+    code = '''def validate(self):
+    """Checks the invoice."""
+    # totals first
+    self.set_totals()  # recompute
+'''
+    assert compress_code(code) == "def validate(self):\n    self.set_totals()"
@@ -0,0 +1,55 @@
+from core.graph_builder import CodeGraphPipeline
+
+
+SOURCE = b'''class SalesInvoice:
+    def validate(self):
+        def check_rows():
+            make_gl_entries()
+        check_rows()
+
+def make_gl_entries():
+    pass
+
+make_gl_entries()
+'''
+
+
+def build_graph():
+    pipeline = CodeGraphPipeline()
+    pipeline.pass_1_symbols("invoice.py", SOURCE)
+    pipeline.pass_2_calls("invoice.py", SOURCE)
+    return pipeline.G
+
+
+def edges_of_type(graph, kind):
+    return {(u, v) for u, v, t in graph.edges(data='type') if t == kind}
+
+
+def test_node_ids():
+    assert set(build_graph().nodes()) == {
+        "invoice.py",
+        "invoice.py:SalesInvoice",
+        # Method inside a class
+        "invoice.py:SalesInvoice:validate",
+        # Nested def inside a method keeps the enclosing class as its parent
+        "invoice.py:SalesInvoice:check_rows",
+        "invoice.py:make_gl_entries",
+    }
+
+
+def test_contains_edges():
+    assert edges_of_type(build_graph(), 'CONTAINS') == {
+        ("invoice.py", "invoice.py:SalesInvoice"),
+        ("invoice.py:SalesInvoice", "invoice.py:SalesInvoice:validate"),
+        ("invoice.py:SalesInvoice", "invoice.py:SalesInvoice:check_rows"),
+        ("invoice.py", "invoice.py:make_gl_entries"),
+    }
+
+
+def test_call_edges():
+    # The call inside the nested def belongs to it, the call after it to the method;
+    # the module-level call has no caller and produces no edge
+    assert edges_of_type(build_graph(), 'CALLS') == {
+        ("invoice.py:SalesInvoice:check_rows", "invoice.py:make_gl_entries"),
+        ("invoice.py:SalesInvoice:validate", "invoice.py:SalesInvoice:check_rows"),
+    }
@@ -2,14 +2,12 @@ import json
 import time
 import os
 import asyncio
-from data.storage import VectorStore  
-from engine.embedder import BGEEmbedder 
 from chat import ModernizationChat 
 class RetrievalEvaluator:
     def __init__(self):
-        self.store = VectorStore()
-        self.embedder = BGEEmbedder()
         self.chat = ModernizationChat()
+        # Share the chat's clients (Gemini model, table handle) instead of opening a second set
+        self.store = self.chat.store
         self.reset_metrics()
 
     def reset_metrics(self):
@@ -62,13 +60,15 @@ class RetrievalEvaluator:
 
         # --- STEP 1: RETRIEVAL ---
         start_time = time.time()
-        query_vector = self.embedder.embed_batch([query])[0]
+        # Through the chat's query cache: generate_domain_model below reuses this vector
+        query_vector = await self.chat.embed_query(query)
         table = self.store.get_table()
         
         if not table:
             return {"error": "Table not found"}
 
-        search_results = table.search(query_vector).limit(k).to_list()
+        # Same metric and search profile as the chat's dense retrieval
+        search_results = self.store.search(query_vector, k, self.chat.search_profile)
         retrieval_latency = (time.time() - start_time) * 1000
 
         rank = 0
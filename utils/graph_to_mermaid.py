@@ -1,13 +1,17 @@
 import networkx as nx
 import os
 
-def export_folder_to_mermaid(gexf_path, folder_name="SalesInvoice", output_file="sales_invoice_flow.md"):
-    if not os.path.exists(gexf_path):
-        print(f"❌ Error: {gexf_path} not found.")
-        return
+def export_folder_to_mermaid(graph_or_path, folder_name="SalesInvoice", output_file="sales_invoice_flow.md"):
+    """`graph_or_path` is a GEXF file path or an in-memory NetworkX graph (which skips the XML parse)."""
+    if isinstance(graph_or_path, nx.Graph):
+        G = graph_or_path
+    else:
+        if not os.path.exists(graph_or_path):
+            print(f"❌ Error: {graph_or_path} not found.")
+            return
 
-    # Load the graph
-    G = nx.read_gexf(gexf_path)
+        # Load the graph
+        G = nx.read_gexf(graph_or_path)
     
     # Convert 'SalesInvoice' to 'sales_invoice' for path matching
     folder_target = folder_name.lower()
@@ -5,8 +5,10 @@ class CodeSearcher:
     def __init__(self):
         self.store = VectorStore()
         self.embedder = BGEEmbedder()
-        self.table = self.store.db.open_table(self.store.table_name)
 
     def search(self, query: str, limit: int = 5):
         query_vec = self.embedder.embed_batch([query])[0]
-        return self.table.search(query_vec).limit(limit).to_list()
+        if query_vec is None:
+            # embed_batch leaves a None slot when the embedding request fails
+            raise RuntimeError(f"Embedding failed for query: {query!r}")
+        return self.store.search(query_vec, limit)